@@ -11,11 +11,36 @@ from gem5.components.processors.simple_processor import SimpleProcessor
 from gem5.isas import ISA
 from gem5.resources.resource import BinaryResource
 from gem5.runtime import get_supported_isas
+from gem5.simulate.exit_event import ExitEvent
 from gem5.simulate.simulator import Simulator
 from gem5.utils.requires import requires
 
 
 from gem5.components.cachehierarchies.ruby.mesi_two_level_cache_hierarchy import (MESITwoLevelCacheHierarchy,)
+from gem5.components.cachehierarchies.classic.private_l1_private_l2_cache_hierarchy import (PrivateL1PrivateL2CacheHierarchy,)
+
+
+class AssocPrivateL1PrivateL2CacheHierarchy(PrivateL1PrivateL2CacheHierarchy):
+    """PrivateL1PrivateL2CacheHierarchy with caller-chosen associativities.
+
+    The stdlib class only takes sizes and fixes associativity internally,
+    so the requested values are applied to the caches it creates.
+    """
+
+    def __init__(self, l1d_size, l1d_assoc, l1i_size, l1i_assoc, l2_size, l2_assoc):
+        super().__init__(l1d_size=l1d_size, l1i_size=l1i_size, l2_size=l2_size)
+        self._requested_assoc = {
+            "l1dcaches": l1d_assoc,
+            "l1icaches": l1i_assoc,
+            "l2caches": l2_assoc,
+        }
+
+    def incorporate_cache(self, board):
+        super().incorporate_cache(board)
+        # Parameters can still change here, before m5.instantiate()
+        for caches, assoc in self._requested_assoc.items():
+            for cache in getattr(self, caches):
+                cache.assoc = assoc
 
 
 gem5_path = os.environ["GEM5"]
@@ -32,6 +57,9 @@ parser.add_argument("--bp_bits", default=2, type=int)
 parser.add_argument("--clock_freq", default="1GHz", type=str)
 parser.add_argument("--l1d_assoc", default="8", type=str)
 parser.add_argument("--l1d_size", default="64KiB", type=str)
+parser.add_argument("--hierarchy", default="ruby", choices=["ruby", "classic"])
+parser.add_argument("--checkpoint-dir", default=None, type=str)
+parser.add_argument("--restore-from", default=None, type=str)
 
 args = parser.parse_args()
 program_str = args.prog
@@ -51,41 +79,57 @@ processor = SimpleProcessor(
     num_cores=1,
 )
 
-# Set the branch predictor
+# Set the branch predictor. The type and parameters are resolved once;
+# each core still gets its own instance since a SimObject has a single parent.
+if bp == "TournamentBP":
+    bp_class = TournamentBP
+    bp_params = dict(
+        localPredictorSize=args.bp_size,
+        localCtrBits=args.bp_bits,
+        globalPredictorSize=args.bp_size,
+        globalCtrBits=args.bp_bits,
+        choicePredictorSize=args.bp_size,
+        choiceCtrBits=args.bp_bits
+    )
+else:
+    bp_class = LocalBP
+    bp_params = dict(
+        localPredictorSize=args.bp_size,
+        localCtrBits=args.bp_bits
+    )
+
 for cpu in processor.get_cores():
-    if bp == "TournamentBP":
-        bp_core = TournamentBP(
-            localPredictorSize=args.bp_size,
-            localCtrBits=args.bp_bits,
-            globalPredictorSize=args.bp_size,
-            globalCtrBits=args.bp_bits,
-            choicePredictorSize=args.bp_size,
-            choiceCtrBits=args.bp_bits
-        )
-        bp_core.btb.numEntries = args.bp_size
-        cpu.core.branchPred = bp_core
-    else:
-        bp_core = LocalBP(
-            localPredictorSize=args.bp_size,
-            localCtrBits=args.bp_bits
-        )
-        bp_core.btb.numEntries = args.bp_size
-        cpu.core.branchPred = bp_core
+    bp_core = bp_class(**bp_params)
+    bp_core.btb.numEntries = args.bp_size
+    cpu.core.branchPred = bp_core
 
 clk_freq = "1GHz"
 if isa in (ISA.ARM, ISA.RISCV):
     clk_freq = "1.2GHz"
 
 
-cache_hierarchy = MESITwoLevelCacheHierarchy(
-    l1d_size=args.l1d_size,
-    l1d_assoc=args.l1d_assoc,
-    l1i_size="16kB",
-    l1i_assoc=2,
-    l2_size="256kB",
-    l2_assoc=8,
-    num_l2_banks=1
-)
+# Classic caches skip Ruby's coherence protocol machinery, which a single
+# core does not need. Ruby MESI stays the default until classic results
+# have been checked against it.
+if args.hierarchy == "ruby":
+    cache_hierarchy = MESITwoLevelCacheHierarchy(
+        l1d_size=args.l1d_size,
+        l1d_assoc=args.l1d_assoc,
+        l1i_size="16kB",
+        l1i_assoc=2,
+        l2_size="256kB",
+        l2_assoc=8,
+        num_l2_banks=1
+    )
+else:
+    cache_hierarchy = AssocPrivateL1PrivateL2CacheHierarchy(
+        l1d_size=args.l1d_size,
+        l1d_assoc=int(args.l1d_assoc),
+        l1i_size="16kB",
+        l1i_assoc=2,
+        l2_size="256kB",
+        l2_assoc=8
+    )
 
 
 memory = SingleChannelDDR3_1600(size="32MB")
@@ -99,17 +143,32 @@ board = SimpleBoard(
 )
 
 
-full_program_path = os.path.join(gem5_testprogs, program_str + "_" + isa_str)
-arguments = []
-if program_str == "daxpy":
-    arguments = [daxpy_N]
-elif program_str == "queens":
-    arguments = [queens_N]
+full_program_path = f"{gem5_testprogs}/{program_str}_{isa_str}"
+PROG_ARGS = {
+    "daxpy": [daxpy_N],
+    "queens": [queens_N],
+}
+arguments = PROG_ARGS[program_str]
 board.set_se_binary_workload(
     BinaryResource(full_program_path),
     arguments=arguments,
 )
 
 
-simulator = Simulator(board=board)
+def workbegin_handler():
+    # At ROI start, reset stats as usual. With --checkpoint-dir (relative
+    # paths are taken inside --outdir), save a checkpoint there and stop so
+    # later runs can --restore-from it.
+    while True:
+        m5.stats.reset()
+        if args.checkpoint_dir:
+            simulator.save_checkpoint(os.path.join(m5.options.outdir, args.checkpoint_dir))
+        yield bool(args.checkpoint_dir)
+
+
+simulator = Simulator(
+    board=board,
+    checkpoint_path=args.restore_from,
+    on_exit_event={ExitEvent.WORKBEGIN: workbegin_handler()},
+)
 simulator.run()
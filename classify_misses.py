@@ -5,19 +5,19 @@ Runs gem5 with different cache configurations to isolate each miss type.
 """
 
 import os
-import subprocess
 import csv
-import re
-from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
+from gem5_driver import SCRIPT_DIR, STAT_NAMES, load_stats, atomic_write, labelled_log
+from sim_cache import cache_dir, ensure_run
 
-# Configuration parameters for miss classification
-CONFIGS = [
-    # (name, l1d_size, l1d_assoc, purpose)
-    ("baseline", "1kB", 2, "Total misses (cold + capacity + conflict)"),
-    ("no_conflict", "1kB", 8, "Cold + capacity misses (no conflict)"),
-    ("no_capacity", "8kB", 8, "Cold misses only (no capacity, no conflict)"),
-]
+
+# Configuration parameters for miss classification. Sizes are in kB and
+# ascending; the first is the cache under study, the last must be large
+# enough that only cold misses remain.
+SIZES = ["1kB", "2kB", "4kB", "8kB"]
+BASELINE_ASSOC = 2
+BLOCK_SIZE = 64  # bytes, gem5's default cache line size
 
 # Common parameters
 CLOCK_FREQ = "1GHz"
@@ -25,106 +25,142 @@ PROGRAM = "queens"
 BP_TYPE = "LocalBP"
 BP_SIZE = 2048
 BP_BITS = 2
+HIERARCHY = "ruby"
+
+
+def run_gem5_simulation(name, l1d_size, l1d_assoc, **extra_args):
+    """Run (or reuse) a single gem5 simulation and return its output dir."""
+
+    params = {
+        "prog": PROGRAM,
+        "bp": BP_TYPE,
+        "bp_size": BP_SIZE,
+        "bp_bits": BP_BITS,
+        "l1d_size": l1d_size,
+        "l1d_assoc": l1d_assoc,
+        "clock_freq": CLOCK_FREQ,
+        "hierarchy": HIERARCHY,
+        **extra_args,
+    }
+
+    log = labelled_log(name)
+    log(f"Running: size={l1d_size}, assoc={l1d_assoc}")
+    log(f"Output dir: {cache_dir(params)}")
+
+    return ensure_run(params, log=log)
+
+
+def create_roi_checkpoint(l1d_size, l1d_assoc):
+    """Run the program up to its ROI once and checkpoint there.
+
+    Only the L1D configuration differs between the classification runs, so
+    each of them can restore from this checkpoint instead of re-executing
+    the program's setup. Returns (checkpoint_dir, output_dir);
+    checkpoint_dir is None if the program never reached an ROI marker, in
+    which case output_dir holds a complete run with this configuration.
+    output_dir is None if the run failed.
+    """
+    # A relative checkpoint dir is placed inside the run's output dir
+    output_dir = run_gem5_simulation(
+        "checkpoint", l1d_size, l1d_assoc, **{"checkpoint-dir": "cpt"}
+    )
 
-# Paths
-GEM5_PATH = os.environ.get("GEM5")
-if not GEM5_PATH:
-    raise RuntimeError("GEM5 environment variable not set")
-
-GEM5_BINARY = os.path.join(GEM5_PATH, "build/X86/gem5.opt")
-SCRIPT_DIR = Path(__file__).parent
-ASSIGNMENT_SCRIPT = SCRIPT_DIR / "assignment3.py"
-
-
-def run_gem5_simulation(name, l1d_size, l1d_assoc, output_dir):
-    """Run a single gem5 simulation with the given configuration."""
-
-    cmd = [
-        GEM5_BINARY,
-        f"--outdir={output_dir}",
-        str(ASSIGNMENT_SCRIPT),
-        f"--prog={PROGRAM}",
-        f"--bp={BP_TYPE}",
-        f"--bp_size={BP_SIZE}",
-        f"--bp_bits={BP_BITS}",
-        f"--l1d_size={l1d_size}",
-        f"--l1d_assoc={l1d_assoc}",
-        f"--clock_freq={CLOCK_FREQ}",
-    ]
-
-    print(f"\nRunning {name}: size={l1d_size}, assoc={l1d_assoc}")
-    print(f"  Output dir: {output_dir}")
-
-    try:
-        result = subprocess.run(
-            cmd,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            universal_newlines=True,
-            check=True,
-            cwd=SCRIPT_DIR
-        )
-        print(f"  ✓ Completed successfully")
-        return True
-    except subprocess.CalledProcessError as e:
-        print(f"  ✗ Failed with error:")
-        print(e.stderr)
-        return False
-
-
-def parse_stat(stats_content, stat_name):
-    """Extract a stat value from stats.txt content."""
-    pattern = rf'^{re.escape(stat_name)}\s+(\S+)'
-    match = re.search(pattern, stats_content, re.MULTILINE)
-    if match:
-        value = match.group(1)
-        # Remove any trailing comments or units
-        value = value.split('#')[0].strip()
-        return value
-    return None
+    if output_dir and (output_dir / "cpt" / "m5.cpt").exists():
+        return output_dir / "cpt", output_dir
+    return None, output_dir
 
 
 def extract_l1d_misses(output_dir):
     """Extract L1D cache misses from gem5 stats.txt file."""
-    stats_file = Path(output_dir) / "stats.txt"
-
-    if not stats_file.exists():
-        print(f"  Warning: {stats_file} not found")
-        return None
-
-    with open(stats_file, 'r') as f:
-        stats_content = f.read()
+    stats = load_stats(output_dir, {"l1d_misses": STAT_NAMES[HIERARCHY]["l1d_misses"]})
 
-    l1d_misses = parse_stat(
-        stats_content,
-        "board.cache_hierarchy.ruby_system.l1_controllers.L1Dcache.m_demand_misses"
-    )
+    l1d_misses = stats.get("l1d_misses") if stats else None
 
     if l1d_misses:
         return int(l1d_misses)
     return None
 
 
-def main():
-    """Main function to run experiments and classify cache misses."""
+def full_assoc_for(size):
+    """Associativity that makes a cache of this size fully associative."""
+    return int(size.rstrip("kKiB")) * 1024 // BLOCK_SIZE
 
-    results = {}
 
-    # Run simulations for each configuration
-    for name, l1d_size, l1d_assoc, purpose in CONFIGS:
-        output_dir = SCRIPT_DIR / f"miss_classify_{name}"
-        output_dir.mkdir(exist_ok=True)
+def classification_configs(sizes, baseline_assoc, full_assoc=None):
+    """Build the (name, l1d_size, l1d_assoc, purpose) runs for classify()."""
+    smallest, largest = sizes[0], sizes[-1]
+    return [
+        ("baseline", smallest, baseline_assoc,
+         "Total misses (cold + capacity + conflict)"),
+        ("no_conflict", smallest, full_assoc or full_assoc_for(smallest),
+         "Cold + capacity misses (no conflict)"),
+        ("no_capacity", largest, full_assoc or full_assoc_for(largest),
+         "Cold misses only (no capacity, no conflict)"),
+    ]
+
+
+def run_and_extract(name, l1d_size, l1d_assoc, **extra_args):
+    """Run one configuration and return its L1D misses, or None on failure."""
+    output_dir = run_gem5_simulation(name, l1d_size, l1d_assoc, **extra_args)
+
+    if output_dir is None:
+        labelled_log(name)(f"  Skipping metrics extraction due to failure")
+        return None
+    return extract_l1d_misses(output_dir)
+
+
+def find_capacity_knee(sizes, results, full_assoc=None, **extra_args):
+    """Binary search sizes for the smallest cache with only cold misses left.
+
+    A fully associative LRU cache never misses more as it grows, so the
+    miss count is monotonic in size and the endpoints from classify() bound
+    the search. Each probe is one extra run; pass a coarser or shorter
+    sizes list to trade resolution for runtime.
+    """
+    cold_misses = results["no_capacity"]["misses"]
+    if results["no_conflict"]["misses"] == cold_misses:
+        return sizes[0]
+
+    lo, hi = 0, len(sizes) - 1
+    while hi - lo > 1:
+        mid = (lo + hi) // 2
+        size = sizes[mid]
+        misses = run_and_extract(
+            f"knee_{size}", size, full_assoc or full_assoc_for(size), **extra_args
+        )
+        if misses is None:
+            return None
+        labelled_log(f"knee_{size}")(f"  L1D misses: {misses}")
+        if misses == cold_misses:
+            hi = mid
+        else:
+            lo = mid
+    return sizes[hi]
+
 
-        # Run simulation
-        success = run_gem5_simulation(name, l1d_size, l1d_assoc, output_dir)
+def classify(sizes=SIZES, baseline_assoc=BASELINE_ASSOC, full_assoc=None, find_knee=False):
+    """Run the miss classification for the smallest of the given sizes.
 
-        if not success:
-            print(f"  Skipping metrics extraction due to failure")
-            continue
+    The smallest size at baseline_assoc gives the total misses. Making it
+    fully associative (associativity = size / block size) removes conflict
+    misses by definition, and the largest size fully associative leaves
+    only cold misses. Then capacity = no_conflict - cold and
+    conflict = total - no_conflict. full_assoc overrides the computed
+    associativity for simulators that cap it.
 
-        # Extract L1D misses
-        misses = extract_l1d_misses(output_dir)
+    With find_knee, also binary search the intermediate sizes for where
+    capacity misses vanish; this costs up to log2(len(sizes)) extra runs,
+    made one after another, so it is off by default.
+
+    Returns ({name: result}, capacity_knee), with capacity_knee None
+    unless find_knee is set.
+    """
+    configs = classification_configs(sizes, baseline_assoc, full_assoc)
+    results = {}
 
+    def record(config, misses):
+        name, l1d_size, l1d_assoc, purpose = config
+        log = labelled_log(name)
         if misses is not None:
             results[name] = {
                 "l1d_size": l1d_size,
@@ -132,9 +168,43 @@ def main():
                 "misses": misses,
                 "purpose": purpose
             }
-            print(f"  L1D misses: {misses}")
+            log(f"  L1D misses: {misses}")
         else:
-            print(f"  Failed to extract misses")
+            log(f"  Failed to extract misses")
+
+    checkpoint_dir, checkpoint_run = create_roi_checkpoint(*configs[0][1:3])
+    pending = configs
+    restore_args = {}
+    if checkpoint_dir:
+        restore_args = {"restore-from": str(checkpoint_dir)}
+    elif checkpoint_run:
+        # Without an ROI marker the checkpoint run simulated the whole
+        # program with the baseline configuration, so it is the baseline
+        print("  No ROI checkpoint produced; using that run as the baseline "
+              "and running the remaining configurations from the start")
+        record(configs[0], extract_l1d_misses(checkpoint_run))
+        pending = configs[1:]
+
+    # Run simulations in parallel; each gem5 process is single-threaded
+    max_workers = min(len(pending), os.cpu_count() or 1)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(run_and_extract, *config[:3], **restore_args): config
+            for config in pending
+        }
+
+        for future in as_completed(futures):
+            record(futures[future], future.result())
+
+    if not find_knee or len(results) != len(configs):
+        return results, None
+    return results, find_capacity_knee(sizes, results, full_assoc, **restore_args)
+
+
+def main():
+    """Main function to run experiments and classify cache misses."""
+
+    results, capacity_knee = classify()
 
     # Calculate miss breakdown
     if len(results) == 3:
@@ -142,14 +212,18 @@ def main():
         print("MISS CLASSIFICATION RESULTS")
         print("="*70)
 
-        total_misses = results["baseline"]["misses"]
-        cold_capacity_misses = results["no_conflict"]["misses"]
-        cold_misses = results["no_capacity"]["misses"]
+        baseline = results["baseline"]
+        no_conflict = results["no_conflict"]
+        no_capacity = results["no_capacity"]
+
+        total_misses = baseline["misses"]
+        cold_capacity_misses = no_conflict["misses"]
+        cold_misses = no_capacity["misses"]
 
         capacity_misses = cold_capacity_misses - cold_misses
         conflict_misses = total_misses - cold_capacity_misses
 
-        print(f"\nBaseline config (1kB, 2-way):")
+        print(f"\nBaseline config ({baseline['l1d_size']}, {baseline['l1d_assoc']}-way):")
         print(f"  Total L1D misses: {total_misses}")
         print(f"\nMiss breakdown:")
         print(f"  Cold misses:     {cold_misses:5d} ({100*cold_misses/total_misses:5.1f}%)")
@@ -157,6 +231,8 @@ def main():
         print(f"  Conflict misses: {conflict_misses:5d} ({100*conflict_misses/total_misses:5.1f}%)")
         print(f"  ---")
         print(f"  Sum:            {cold_misses + capacity_misses + conflict_misses:5d} (should equal total)")
+        if capacity_knee:
+            print(f"\nCapacity misses vanish at: {capacity_knee} (fully associative)")
 
         # Verification
         if cold_misses + capacity_misses + conflict_misses == total_misses:
@@ -166,42 +242,44 @@ def main():
 
         # Write results to CSV
         csv_file = SCRIPT_DIR / "miss_classification.csv"
-        with open(csv_file, 'w', newline='') as f:
-            writer = csv.writer(f)
-            writer.writerow([
+        rows = [
+            [
                 "Miss Type",
                 "Total Misses",
                 "Percentage",
                 "Configuration Used To Discover This"
-            ])
-
-            writer.writerow([
+            ],
+            [
                 "Total",
                 total_misses,
                 "100%",
-                f"L1D$ Size: {results['baseline']['l1d_size']} — L1D$ Association: {results['baseline']['l1d_assoc']}"
-            ])
-
-            writer.writerow([
+                f"L1D$ Size: {baseline['l1d_size']} — L1D$ Association: {baseline['l1d_assoc']}"
+            ],
+            [
                 "Cold",
                 cold_misses,
                 f"{100*cold_misses/total_misses:.1f}%",
-                f"L1D$ Size: {results['no_capacity']['l1d_size']} — L1D$ Association: {results['no_capacity']['l1d_assoc']}"
-            ])
-
-            writer.writerow([
+                f"L1D$ Size: {no_capacity['l1d_size']} — L1D$ Association: {no_capacity['l1d_assoc']}"
+            ],
+            [
                 "Capacity",
                 capacity_misses,
                 f"{100*capacity_misses/total_misses:.1f}%",
-                f"Difference between (1kB, 8-way) and (8kB, 8-way)"
-            ])
-
-            writer.writerow([
+                f"Difference between ({no_conflict['l1d_size']}, {no_conflict['l1d_assoc']}-way) "
+                f"and ({no_capacity['l1d_size']}, {no_capacity['l1d_assoc']}-way)"
+            ],
+            [
                 "Conflict",
                 conflict_misses,
                 f"{100*conflict_misses/total_misses:.1f}%",
-                f"Difference between (1kB, 2-way) and (1kB, 8-way)"
-            ])
+                f"Difference between ({baseline['l1d_size']}, {baseline['l1d_assoc']}-way) "
+                f"and ({no_conflict['l1d_size']}, {no_conflict['l1d_assoc']}-way)"
+            ],
+        ]
+
+        with atomic_write(csv_file) as f:
+            writer = csv.writer(f)
+            writer.writerows(rows)
 
         print(f"\n✓ Results written to {csv_file}")
 
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Shared helpers for the experiment scripts: launching gem5 on
+assignment3.py and reading values back out of stats.txt.
+"""
+
+import os
+import re
+import subprocess
+import sys
+import mmap
+import tempfile
+from contextlib import contextmanager
+from functools import lru_cache
+from pathlib import Path
+
+
+# Paths
+GEM5_PATH = os.environ.get("GEM5")
+if not GEM5_PATH:
+    raise RuntimeError("GEM5 environment variable not set")
+
+GEM5_BINARY = os.path.join(GEM5_PATH, "build/X86/gem5.opt")
+SCRIPT_DIR = Path(__file__).parent
+ASSIGNMENT_SCRIPT = SCRIPT_DIR / "assignment3.py"
+
+# stats.txt files larger than this (bytes) are scanned through mmap
+MMAP_THRESHOLD = 50 * 1024 * 1024
+
+# Stat names for each --hierarchy, keyed by the name the scripts use
+STAT_NAMES = {
+    "ruby": {
+        "instructions": "board.processor.cores.core.thread_0.numInsts",
+        "cpu_cycles": "board.processor.cores.core.numCycles",
+        "l1d_hits": "board.cache_hierarchy.ruby_system.l1_controllers.L1Dcache.m_demand_hits",
+        "l1d_misses": "board.cache_hierarchy.ruby_system.l1_controllers.L1Dcache.m_demand_misses",
+        "l1d_accesses": "board.cache_hierarchy.ruby_system.l1_controllers.L1Dcache.m_demand_accesses",
+        "l1i_misses": "board.cache_hierarchy.ruby_system.l1_controllers.L1Icache.m_demand_misses",
+        "l1i_accesses": "board.cache_hierarchy.ruby_system.l1_controllers.L1Icache.m_demand_accesses",
+        "l2_misses": "board.cache_hierarchy.ruby_system.l2_controllers.L2cache.m_demand_misses",
+        "l2_accesses": "board.cache_hierarchy.ruby_system.l2_controllers.L2cache.m_demand_accesses",
+        "l1_replacements": "board.cache_hierarchy.ruby_system.L1Cache_Controller.L1_Replacement",
+        "avg_gap": "board.memory.mem_ctrl.avgGap",
+    },
+    "classic": {
+        "instructions": "board.processor.cores.core.thread_0.numInsts",
+        "cpu_cycles": "board.processor.cores.core.numCycles",
+        "l1d_hits": "board.cache_hierarchy.l1dcaches.demandHits::total",
+        "l1d_misses": "board.cache_hierarchy.l1dcaches.demandMisses::total",
+        "l1d_accesses": "board.cache_hierarchy.l1dcaches.demandAccesses::total",
+        "l1i_misses": "board.cache_hierarchy.l1icaches.demandMisses::total",
+        "l1i_accesses": "board.cache_hierarchy.l1icaches.demandAccesses::total",
+        "l2_misses": "board.cache_hierarchy.l2caches.demandMisses::total",
+        "l2_accesses": "board.cache_hierarchy.l2caches.demandAccesses::total",
+        "l1_replacements": "board.cache_hierarchy.l1dcaches.replacements",
+        "avg_gap": "board.memory.mem_ctrl.avgGap",
+    },
+}
+
+
+def labelled_log(label):
+    """Return a log function that prefixes every line with [label].
+
+    Runs execute concurrently, so each job logs through its own labelled
+    function to keep its output attributable.
+    """
+    def log(message=""):
+        lines = str(message).splitlines() or [""]
+        # One write per message so lines from different threads don't split
+        sys.stdout.write("".join(f"[{label}] {line}\n" for line in lines))
+        sys.stdout.flush()
+    return log
+
+
+def run_gem5(args, output_dir, *, log=print):
+    """Run assignment3.py under gem5 with {flag: value} args.
+
+    Each configuration needs its own gem5 process: m5.instantiate() can
+    only be called once per process, so a board cannot be rebuilt with a
+    different cache hierarchy after it has been simulated. Startup is paid
+    once per config; the thread pool only overlaps it.
+
+    Returns True on success. Use sim_cache.ensure_run to reuse earlier results.
+    """
+
+    cmd = [
+        GEM5_BINARY,
+        f"--outdir={output_dir}",
+        str(ASSIGNMENT_SCRIPT),
+        *(f"--{flag}={value}" for flag, value in args.items()),
+    ]
+
+    try:
+        # gem5 progress output goes to a log file instead of a pipe buffer
+        with open(Path(output_dir) / "gem5.out", "wb") as stdout_f:
+            subprocess.run(
+                cmd,
+                stdout=stdout_f,
+                stderr=subprocess.PIPE,
+                check=True,
+                cwd=SCRIPT_DIR
+            )
+        log(f"  ✓ Completed successfully")
+        return True
+    except subprocess.CalledProcessError as e:
+        log(f"  ✗ Failed with error:")
+        log(e.stderr.decode(errors="replace"))
+        return False
+
+
+@lru_cache(maxsize=None)
+def stats_pattern(stat_names, binary):
+    """Compile one regex matching any of stat_names at the start of a line."""
+    alternation = "|".join(re.escape(name) for name in stat_names)
+    pattern = rf"^({alternation})[ \t]+([^\s#]+)"
+    return re.compile(pattern.encode() if binary else pattern, re.MULTILINE)
+
+
+def scan_stats(content, stat_names):
+    """Return {stat_name: value} from one pass over str or bytes content."""
+    binary = isinstance(content, (bytes, mmap.mmap))
+    values = {}
+    for match in stats_pattern(stat_names, binary).finditer(content):
+        name, value = match.groups()
+        if binary:
+            name, value = name.decode(), value.decode()
+        values.setdefault(name, value)
+        # Everything wanted is in the first dump; skip the rest
+        if len(values) == len(stat_names):
+            break
+    return values
+
+
+def load_stats(output_dir, stat_names):
+    """Look up each {key: stat_name} in output_dir/stats.txt.
+
+    All stats are found in a single regex scan, keeping the first (ROI)
+    dump's value for each. Files above MMAP_THRESHOLD are memory-mapped
+    rather than read into memory.
+
+    Returns {key: value} for the stats that were found, or None if
+    stats.txt is missing or unreadable.
+    """
+    stats_file = Path(output_dir) / "stats.txt"
+
+    if not stats_file.exists():
+        print(f"  Warning: {stats_file} not found")
+        return None
+
+    names = tuple(sorted(set(stat_names.values())))
+    try:
+        if stats_file.stat().st_size <= MMAP_THRESHOLD:
+            # Stray non-UTF-8 bytes only ever appear in descriptions
+            values = scan_stats(stats_file.read_text(errors="ignore"), names)
+        else:
+            with open(stats_file, 'rb') as f, \
+                    mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                values = scan_stats(mm, names)
+    except OSError as e:
+        print(f"  Warning: could not read {stats_file}: {e}")
+        return None
+
+    return {key: values[name] for key, name in stat_names.items() if name in values}
+
+
+@contextmanager
+def atomic_write(path):
+    """Open a temp file next to path for writing and move it into place on success.
+
+    An interrupted run leaves the previous file intact instead of a
+    partially written one.
+    """
+    path = Path(path)
+    tmp = tempfile.NamedTemporaryFile('w', newline='', dir=path.parent, delete=False)
+    try:
+        with tmp:
+            yield tmp
+        # NamedTemporaryFile is created 0600; keep the usual results permissions
+        os.chmod(tmp.name, path.stat().st_mode if path.exists() else 0o644)
+        os.replace(tmp.name, path)
+    except BaseException:
+        os.unlink(tmp.name)
+        raise
@@ -5,10 +5,12 @@ and collect performance metrics.
 """
 
 import os
-import subprocess
 import csv
-import re
-from pathlib import Path
+import math
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from gem5_driver import SCRIPT_DIR, STAT_NAMES, load_stats, atomic_write, labelled_log
+from sim_cache import cache_dir, ensure_run
 
 
 # Configuration parameters
@@ -29,103 +31,69 @@ PROGRAM = "queens"
 BP_TYPE = "LocalBP"  # Changed from SimpleBP to LocalBP
 BP_SIZE = 16
 BP_BITS = 2
+HIERARCHY = "ruby"
 
-# Paths
-GEM5_PATH = os.environ.get("GEM5")
-if not GEM5_PATH:
-    raise RuntimeError("GEM5 environment variable not set")
-
-GEM5_BINARY = os.path.join(GEM5_PATH, "build/X86/gem5.opt")
-SCRIPT_DIR = Path(__file__).parent
-ASSIGNMENT_SCRIPT = SCRIPT_DIR / "assignment3.py"
-
-
-def run_gem5_simulation(clock_freq, l1d_assoc, l1d_size, output_dir):
-    """Run a single gem5 simulation with the given configuration."""
-
-    cmd = [
-        GEM5_BINARY,
-        f"--outdir={output_dir}",
-        str(ASSIGNMENT_SCRIPT),
-        f"--prog={PROGRAM}",
-        f"--bp={BP_TYPE}",
-        f"--bp_size={BP_SIZE}",
-        f"--bp_bits={BP_BITS}",
-        f"--l1d_size={l1d_size}",
-        f"--l1d_assoc={l1d_assoc}",
-        f"--clock_freq={clock_freq}",
-    ]
-
-    print(f"Running: clock={clock_freq}, l1d_assoc={l1d_assoc}, l1d_size={l1d_size}")
-    print(f"Output dir: {output_dir}")
-
-    try:
-        result = subprocess.run(
-            cmd,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            universal_newlines=True,
-            check=True,
-            cwd=SCRIPT_DIR
-        )
-        print(f"  ✓ Completed successfully")
-        return True
-    except subprocess.CalledProcessError as e:
-        print(f"  ✗ Failed with error:")
-        print(e.stderr)
-        return False
-
-
-def parse_stat(stats_content, stat_name):
-    """Extract a stat value from stats.txt content."""
-    pattern = rf'^{re.escape(stat_name)}\s+(\S+)'
-    match = re.search(pattern, stats_content, re.MULTILINE)
-    if match:
-        value = match.group(1)
-        # Remove any trailing comments or units
-        value = value.split('#')[0].strip()
-        return value
-    return "N/A"
+# Stats pulled from stats.txt, keyed by the name used in extract_metrics
+STATS = STAT_NAMES[HIERARCHY]
 
+# Metrics kept as floats in results and formatted only when written out
+MISS_RATE_FIELDS = ("l1d_miss_rate", "l1i_miss_rate", "l2_miss_rate")
 
-def extract_metrics(output_dir):
-    """Extract performance metrics from gem5 stats.txt file."""
-    stats_file = Path(output_dir) / "stats.txt"
 
-    if not stats_file.exists():
-        print(f"  Warning: {stats_file} not found")
-        return None
+def config_label(clock_freq, l1d_assoc, l1d_size):
+    """Short name for a configuration, used to tag its log lines."""
+    return f"clk{clock_freq}_assoc{l1d_assoc}_size{l1d_size}"
 
-    with open(stats_file, 'r') as f:
-        stats_content = f.read()
 
-    # Extract raw stats
-    instructions = parse_stat(stats_content, "board.processor.cores.core.thread_0.numInsts")
-    cpu_cycles = parse_stat(stats_content, "board.processor.cores.core.numCycles")
+def run_gem5_simulation(clock_freq, l1d_assoc, l1d_size):
+    """Run (or reuse) a single gem5 simulation and return its output dir."""
+
+    params = {
+        "prog": PROGRAM,
+        "bp": BP_TYPE,
+        "bp_size": BP_SIZE,
+        "bp_bits": BP_BITS,
+        "l1d_size": l1d_size,
+        "l1d_assoc": l1d_assoc,
+        "clock_freq": clock_freq,
+        "hierarchy": HIERARCHY,
+    }
+
+    log = labelled_log(config_label(clock_freq, l1d_assoc, l1d_size))
+    log(f"Running: clock={clock_freq}, l1d_assoc={l1d_assoc}, l1d_size={l1d_size}")
+    log(f"Output dir: {cache_dir(params)}")
 
-    l1d_hits = parse_stat(stats_content, "board.cache_hierarchy.ruby_system.l1_controllers.L1Dcache.m_demand_hits")
-    l1d_misses = parse_stat(stats_content, "board.cache_hierarchy.ruby_system.l1_controllers.L1Dcache.m_demand_misses")
-    l1d_accesses = parse_stat(stats_content, "board.cache_hierarchy.ruby_system.l1_controllers.L1Dcache.m_demand_accesses")
+    return ensure_run(params, log=log)
 
-    l1i_misses = parse_stat(stats_content, "board.cache_hierarchy.ruby_system.l1_controllers.L1Icache.m_demand_misses")
-    l1i_accesses = parse_stat(stats_content, "board.cache_hierarchy.ruby_system.l1_controllers.L1Icache.m_demand_accesses")
 
-    l2_misses = parse_stat(stats_content, "board.cache_hierarchy.ruby_system.l2_controllers.L2cache.m_demand_misses")
-    l2_accesses = parse_stat(stats_content, "board.cache_hierarchy.ruby_system.l2_controllers.L2cache.m_demand_accesses")
+def extract_metrics(output_dir):
+    """Extract performance metrics from gem5 stats.txt file."""
+    stats = load_stats(output_dir, STATS)
+
+    if stats is None:
+        return None
 
-    l1_replacements = parse_stat(stats_content, "board.cache_hierarchy.ruby_system.L1Cache_Controller.L1_Replacement")
-    avg_gap = parse_stat(stats_content, "board.memory.mem_ctrl.avgGap")
+    # Extract raw stats
+    instructions = stats.get("instructions", "N/A")
+    cpu_cycles = stats.get("cpu_cycles", "N/A")
+
+    l1d_hits = stats.get("l1d_hits", "N/A")
+    l1_replacements = stats.get("l1_replacements", "N/A")
+    avg_gap = stats.get("avg_gap", "N/A")
+
+    # Miss rates stay numeric (NaN when unavailable) until the CSV is written
+    numeric = {
+        key: float(stats[key]) if key in stats else math.nan
+        for key in ("l1d_misses", "l1d_accesses", "l1i_misses",
+                    "l1i_accesses", "l2_misses", "l2_accesses")
+    }
 
-    # Calculate miss rates
     def calc_miss_rate(misses, accesses):
-        try:
-            return f"{(float(misses) / float(accesses)):.6f}" if accesses != "N/A" and float(accesses) > 0 else "N/A"
-        except:
-            return "N/A"
+        return numeric[misses] / numeric[accesses] if numeric[accesses] > 0 else math.nan
 
-    l1d_miss_rate = calc_miss_rate(l1d_misses, l1d_accesses)
-    l1i_miss_rate = calc_miss_rate(l1i_misses, l1i_accesses)
-    l2_miss_rate = calc_miss_rate(l2_misses, l2_accesses)
+    l1d_miss_rate = calc_miss_rate("l1d_misses", "l1d_accesses")
+    l1i_miss_rate = calc_miss_rate("l1i_misses", "l1i_accesses")
+    l2_miss_rate = calc_miss_rate("l2_misses", "l2_accesses")
 
     metrics = {
         "instructions_committed": instructions,
@@ -141,39 +109,50 @@ def extract_metrics(output_dir):
     return metrics
 
 
+def format_miss_rate(rate):
+    """Format a miss rate for the CSV, using N/A for missing values."""
+    return "N/A" if math.isnan(rate) else f"{rate:.6f}"
+
+
 def main():
     """Main function to run all experiments and collect results."""
 
-    results = []
-
-    # Run simulations for each configuration
-    for clock_freq, l1d_assoc, l1d_size in CONFIGS:
-        # Create output directory name
-        output_dir = f"results_clk{clock_freq}_assoc{l1d_assoc}_size{l1d_size}"
-        output_dir = SCRIPT_DIR / output_dir
-        output_dir.mkdir(exist_ok=True)
-
-        # Run simulation
-        success = run_gem5_simulation(clock_freq, l1d_assoc, l1d_size, output_dir)
-
-        if not success:
-            print(f"  Skipping metrics extraction due to failure")
-            continue
-
-        # Extract metrics
-        metrics = extract_metrics(output_dir)
-
-        if metrics:
-            result = {
-                "clock_freq": clock_freq,
-                "l1d_assoc": l1d_assoc,
-                "l1d_size": l1d_size,
-                **metrics
-            }
-            results.append(result)
-            print(f"  Extracted metrics successfully")
-        else:
-            print(f"  Failed to extract metrics")
+    results = {}
+
+    # Run simulations in parallel; each gem5 process is single-threaded
+    max_workers = min(len(CONFIGS), os.cpu_count() or 1)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(run_gem5_simulation, *config): config
+            for config in CONFIGS
+        }
+
+        for future in as_completed(futures):
+            config = futures[future]
+            clock_freq, l1d_assoc, l1d_size = config
+            log = labelled_log(config_label(*config))
+            output_dir = future.result()
+
+            if output_dir is None:
+                log(f"  Skipping metrics extraction due to failure")
+                continue
+
+            # Extract metrics
+            metrics = extract_metrics(output_dir)
+
+            if metrics:
+                results[config] = {
+                    "clock_freq": clock_freq,
+                    "l1d_assoc": l1d_assoc,
+                    "l1d_size": l1d_size,
+                    **metrics
+                }
+                log(f"  Extracted metrics")
+            else:
+                log(f"  Failed to extract metrics")
+
+    # Keep CSV rows in CONFIGS order regardless of completion order
+    results = [results[config] for config in CONFIGS if config in results]
 
     # Write results to CSV
     if results:
@@ -192,10 +171,13 @@ def main():
             "cpu_cycles"
         ]
 
-        with open(csv_file, 'w', newline='') as f:
+        with atomic_write(csv_file) as f:
             writer = csv.DictWriter(f, fieldnames=fieldnames)
             writer.writeheader()
-            writer.writerows(results)
+            writer.writerows(
+                {**result, **{field: format_miss_rate(result[field]) for field in MISS_RATE_FIELDS}}
+                for result in results
+            )
 
         print(f"\n✓ Results written to {csv_file}")
         print(f"  Total configurations tested: {len(results)}")
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Result cache shared by the experiment scripts. Each distinct set of
+assignment3.py arguments maps to one output directory under .sim_cache/,
+named after the configuration plus a short hash, so repeating any
+earlier configuration from either script reuses its results.
+"""
+
+import hashlib
+import json
+from pathlib import Path
+
+from gem5_driver import SCRIPT_DIR, run_gem5
+
+
+ROOT = SCRIPT_DIR / ".sim_cache"
+
+
+def canonical(params):
+    """params with paths inside the cache made relative to ROOT.
+
+    A --restore-from checkpoint is then identified by the cache entry that
+    produced it, whose name embeds that entry's key, rather than by where
+    the checkout happens to live.
+    """
+    root = ROOT.resolve()
+    result = {}
+    for flag, value in params.items():
+        if isinstance(value, (str, Path)) and Path(value).is_absolute():
+            path = Path(value).resolve()
+            if path.is_relative_to(root):
+                value = path.relative_to(root).as_posix()
+        result[flag] = value
+    return result
+
+
+def key(params):
+    """Canonical hash of a {flag: value} set of assignment3.py arguments."""
+    return hashlib.sha1(json.dumps(canonical(params), sort_keys=True, default=str).encode()).hexdigest()
+
+
+def describe(params):
+    """Readable prefix for a cache entry's directory name."""
+    name = (
+        f"{params.get('prog')}_clk{params.get('clock_freq')}"
+        f"_assoc{params.get('l1d_assoc')}_size{params.get('l1d_size')}"
+    )
+    if "checkpoint-dir" in params:
+        name += "_checkpoint"
+    if "restore-from" in params:
+        name += "_restored"
+    return name
+
+
+def cache_dir(params):
+    """Output directory that holds (or will hold) the results for params."""
+    return ROOT / f"{describe(params)}-{key(params)[:12]}"
+
+
+def ensure_run(params, *, log=print):
+    """Return the output directory for params, running gem5 only if needed.
+
+    The full arguments are recorded in params.json next to the results.
+    Returns None if the simulation fails.
+    """
+    output_dir = cache_dir(params)
+    if (output_dir / "stats.txt").exists() and (output_dir / ".ok").exists():
+        log(f"  ✓ Reusing cached results")
+        return output_dir
+
+    output_dir.mkdir(parents=True, exist_ok=True)
+    (output_dir / "params.json").write_text(
+        json.dumps(canonical(params), indent=2, sort_keys=True, default=str) + "\n"
+    )
+    if not run_gem5(params, output_dir, log=log):
+        return None
+    (output_dir / ".ok").touch()
+    return output_dir